@@ -1,4 +1,5 @@
-from mycroft_ptt.speech.listener import RecognizerLoop
+import gc
+import json
 from mycroft_ptt.configuration import CONFIGURATION
 from jarbas_hive_mind.slave.terminal import HiveMindTerminalProtocol, \
     HiveMindTerminal
@@ -6,11 +7,12 @@ from jarbas_hive_mind import HiveMindConnection
 from ovos_utils.log import LOG
 from ovos_utils import create_daemon
 from ovos_utils.messagebus import Message
-from text2speech import TTSFactory
 from tempfile import gettempdir
-from os.path import join, isdir
-from os import makedirs
-from mycroft_ptt.playback import play_audio, play_mp3, play_ogg, play_wav
+from hashlib import blake2b
+from os.path import join, exists
+from os import makedirs, remove, replace
+from mycroft_ptt.playback import play_audio, play_mp3, play_ogg, play_wav, \
+    PCMPlayer
 
 
 class JarbasPtTTerminalProtocol(HiveMindTerminalProtocol):
@@ -34,23 +36,45 @@ class JarbasPtTTerminal(HiveMindTerminal):
 
     def __init__(self, config=CONFIGURATION, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # imported here, audio and TTS backends are slow to load
+        from mycroft_ptt.speech.listener import RecognizerLoop
+        from text2speech import TTSFactory
         self.config = config
         self.loop = RecognizerLoop(self.config)
         self.tts = TTSFactory.create(self.config["tts"])
         LOG.debug("Using TTS engine: " + self.tts.__class__.__name__)
         self.tts.validate()
+        self._tts_tempdir = join(gettempdir(), self.tts.tts_name)
+        tts_config = json.dumps(self.config["tts"], sort_keys=True)
+        self._tts_cache_key = tts_config.encode("utf-8") + b"\0"
+        makedirs(self._tts_tempdir, exist_ok=True)
+        pcm_cmd = self.config["playback"].get("play_pcm_cmd")
+        self._pcm_player = PCMPlayer(pcm_cmd) if pcm_cmd else None
 
     # Voice Output
     def speak(self, utterance):
         LOG.info("SPEAK: " + utterance)
-        temppath = join(gettempdir(), self.tts.tts_name)
-        if not isdir(temppath):
-            makedirs(temppath)
-        audio_file = join(temppath, str(hash(utterance))[1:] +
-                          "." + self.tts.audio_ext)
-        self.tts.get_tts(utterance, audio_file)
+        # stable across restarts, unlike hash(), so the cache can be reused,
+        # the tts config is part of the key so voice/lang changes are heard
+        utt_hash = blake2b(self._tts_cache_key, digest_size=16)
+        utt_hash.update(utterance.encode("utf-8"))
+        file_name = utt_hash.hexdigest() + "." + self.tts.audio_ext
+        audio_file = join(self._tts_tempdir, file_name)
+        # repeated phrases are played back from the cached file
+        if not exists(audio_file):
+            # synthesize under a temporary name, a failed synthesis must
+            # not leave a truncated file behind in the cache
+            tmp_file = join(self._tts_tempdir, "tmp_" + file_name)
+            try:
+                self.tts.get_tts(utterance, tmp_file)
+                replace(tmp_file, audio_file)
+            finally:
+                if exists(tmp_file):
+                    remove(tmp_file)
         try:
-            if audio_file.endswith(".wav"):
+            if audio_file.endswith(".wav") and self._pcm_player:
+                self._pcm_player.play_wav(audio_file)
+            elif audio_file.endswith(".wav"):
                 play_wav(audio_file).wait()
             elif audio_file.endswith(".mp3"):
                 play_mp3(audio_file).wait()
@@ -131,6 +155,9 @@ class JarbasPtTTerminal(HiveMindTerminal):
                                   self.handle_record_end)
         self.loop.remove_listener('recognizer_loop:ambient_noise',
                                   self.handle_ambient_noise)
+        if self._pcm_player:
+            # release the audio device, reopened on the next wav played
+            self._pcm_player.stop()
 
     # parsed protocol messages
     def handle_incoming_mycroft(self, message):
@@ -153,4 +180,9 @@ def connect_to_hivemind(config=CONFIGURATION, host="wss://127.0.0.1",
                                  crypto_key=crypto_key,
                                  headers=con.get_headers(name, access_key))
 
+    # move the long lived startup objects out of the collector's reach so
+    # they are not rescanned while recording
+    gc.collect()
+    gc.freeze()
+
     con.connect(terminal)
@@ -1,3 +1,4 @@
+import gc
 from mycroft_ptt import connect_to_hivemind, JarbasPtTTerminal
 from jarbas_hive_mind import HiveMindConnection
 from jarbas_hive_mind.discovery import LocalDiscovery
@@ -11,6 +12,12 @@ def discover_hivemind(name="JarbasPushToTalkTerminal",
     discovery = LocalDiscovery()
     headers = HiveMindConnection.get_headers(name, access_key)
 
+    # node.connect builds the terminal and does not return while connected,
+    # freeze the startup objects (modules, discovery) before scanning so
+    # they are not rescanned by the collector while recording
+    gc.collect()
+    gc.freeze()
+
     while True:
         LOG.info("Scanning...")
         for node_url in discovery.scan():
@@ -1,5 +1,6 @@
 from json_database import JsonStorageXDG
-from os.path import exists, expanduser, join
+from functools import lru_cache
+from os.path import expanduser, join
 from tempfile import gettempdir
 
 DEFAULT_CONFIGURATION = {
@@ -45,7 +46,11 @@ DEFAULT_CONFIGURATION = {
         'play_wav_cmd': "aplay %1",
         'play_mp3_cmd': "mpg123 %1",
         'play_ogg_cmd': "ogg123 -q %1",
-        'play_fallback_cmd': "play %1"
+        'play_fallback_cmd': "play %1",
+        # long running player fed with raw PCM for TTS wav files, e.g.
+        # "aplay -q -t raw -r {rate} -f {format} -c {channels}"
+        # None spawns play_wav_cmd for every utterance
+        'play_pcm_cmd': None
     },
 
     'log_blacklist': [],
@@ -83,7 +88,17 @@ def _merge_defaults(base, default=None):
     return base
 
 
-CONFIGURATION = JsonStorageXDG("HivemindPtT")
-CONFIGURATION = _merge_defaults(CONFIGURATION)
-if not exists(CONFIGURATION.path):
-    CONFIGURATION.store()
+@lru_cache(maxsize=1)
+def _build_configuration():
+    """
+        Load the user configuration, fill in missing defaults and persist it.
+
+        Cached, the merge only runs once per process.
+    """
+    config = _merge_defaults(JsonStorageXDG("HivemindPtT"))
+    # persist any newly merged defaults, not only on first run
+    config.store()
+    return config
+
+
+CONFIGURATION = _build_configuration()
@@ -2,6 +2,15 @@ from ovos_utils.sound import play_audio as _play_audio, \
     play_wav as _play_wav, play_mp3 as _play_mp3, play_ogg as _play_ogg
 from mycroft_ptt.configuration import CONFIGURATION
 from os.path import join, dirname, expanduser, normpath, abspath, isfile
+from ovos_utils.log import LOG
+from threading import Lock
+from time import monotonic, sleep
+import shlex
+import subprocess
+import wave
+
+# aplay sample formats by sample width in bytes
+_PCM_FORMATS = {1: "U8", 2: "S16_LE", 3: "S24_3LE", 4: "S32_LE"}
 
 
 def play_audio(uri):
@@ -24,6 +33,86 @@ def play_ogg(uri):
     return _play_ogg(uri, cmd)
 
 
+class PCMPlayer:
+    """Play wav files through a single long running player process.
+
+    The raw audio is written to the player's stdin, so no process is
+    launched per file. The player is only restarted when the audio format
+    changes. It keeps the audio device open until stop is called.
+    """
+
+    def __init__(self, cmd=None):
+        self.cmd = cmd or CONFIGURATION["playback"].get("play_pcm_cmd")
+        if not self.cmd:
+            raise ValueError("PCMPlayer needs a player command, "
+                             "set playback.play_pcm_cmd")
+        self._proc = None
+        self._params = None
+        # monotonic time at which the audio written so far ends playing
+        self._playing_until = 0
+        self._lock = Lock()
+
+    def _get_process(self, params):
+        if self._proc is None or self._proc.poll() is not None or \
+                params != self._params:
+            self._close()
+            rate, sample_width, channels = params
+            cmd = self.cmd.format(rate=rate,
+                                  format=_PCM_FORMATS[sample_width],
+                                  channels=channels)
+            self._proc = subprocess.Popen(shlex.split(cmd),
+                                          stdin=subprocess.PIPE)
+            self._params = params
+        return self._proc
+
+    def _close(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait()  # let queued audio finish playing
+            except OSError:
+                pass
+            self._proc = None
+            self._params = None
+            self._playing_until = 0
+
+    def play_wav(self, uri):
+        """Play a wav file, falls back to play_wav on error.
+
+        Like play_wav(uri).wait() this returns once the file has been
+        played, the pipe only saves the player launch.
+        """
+        try:
+            with wave.open(uri, "rb") as f:
+                params = (f.getframerate(), f.getsampwidth(),
+                          f.getnchannels())
+                frames = f.readframes(f.getnframes())
+                duration = f.getnframes() / f.getframerate()
+            with self._lock:
+                proc = self._get_process(params)
+                # playback starts now, or after the audio already queued,
+                # the write below blocks while the player drains the pipe
+                start = max(self._playing_until, monotonic())
+                self._playing_until = playing_until = start + duration
+                proc.stdin.write(frames)
+                proc.stdin.flush()
+        except (wave.Error, KeyError, OSError) as e:
+            LOG.warning("PCM playback failed, spawning player: " + str(e))
+            with self._lock:
+                self._close()
+            play_wav(uri).wait()
+            return
+        # the write returns as soon as the pipe buffered the audio
+        remaining = playing_until - monotonic()
+        if remaining > 0:
+            sleep(remaining)
+
+    def stop(self):
+        """Close the player process once queued audio has been played."""
+        with self._lock:
+            self._close()
+
+
 def resolve_resource_file(res_name):
     """Convert a resource into an absolute filename.
 
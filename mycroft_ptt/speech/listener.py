@@ -19,7 +19,6 @@ from time import sleep, time as get_time
 import json
 from threading import Thread
 import speech_recognition as sr
-import pyaudio
 from pyee import EventEmitter
 from requests import RequestException
 from requests.exceptions import ConnectionError
@@ -40,6 +39,7 @@ AUDIO_DATA = 0
 STREAM_START = 1
 STREAM_DATA = 2
 STREAM_STOP = 3
+STREAM_END = 4
 
 
 def find_input_device(device_name):
@@ -50,22 +50,30 @@ def find_input_device(device_name):
 
         Returns: device_index (int) or None if device wasn't found
     """
+    import pyaudio
     LOG.info('Searching for input device: {}'.format(device_name))
     LOG.debug('Devices: ')
     pa = pyaudio.PyAudio()
     pattern = re.compile(device_name)
-    for device_index in range(pa.get_device_count()):
-        dev = pa.get_device_info_by_index(device_index)
-        LOG.debug('   {}'.format(dev['name']))
-        if dev['maxInputChannels'] > 0 and pattern.match(dev['name']):
-            LOG.debug('    ^-- matched')
-            return device_index
+    try:
+        for device_index in range(pa.get_device_count()):
+            dev = pa.get_device_info_by_index(device_index)
+            LOG.debug('   {}'.format(dev['name']))
+            if dev['maxInputChannels'] > 0 and pattern.match(dev['name']):
+                LOG.debug('    ^-- matched')
+                return device_index
+    finally:
+        # the microphone opens its own instance
+        pa.terminate()
     return None
 
 
 class AudioStreamHandler:
-    def __init__(self, queue):
+    def __init__(self, queue, is_streaming=True):
         self.queue = queue
+        # when streaming the transcription comes from the stream alone and
+        # the recognizer does not need to buffer the whole phrase
+        self.is_streaming = is_streaming
 
     def stream_start(self):
         self.queue.put((STREAM_START, None))
@@ -76,6 +84,14 @@ class AudioStreamHandler:
     def stream_stop(self):
         self.queue.put((STREAM_STOP, None))
 
+    def finalize(self, audio_length):
+        """Request the transcription of a phrase that was only streamed.
+
+        Arguments:
+            audio_length (float): duration of the streamed phrase in seconds
+        """
+        self.queue.put((STREAM_END, audio_length))
+
 
 class AudioProducer(Thread):
     """AudioProducer
@@ -105,7 +121,8 @@ class AudioProducer(Thread):
                                                    self.stream_handler)
                     if audio is not None:
                         self.queue.put((AUDIO_DATA, audio))
-                    else:
+                    elif self.stream_handler is None or \
+                            not self.stream_handler.is_streaming:
                         LOG.warning("Audio contains no data.")
                 except IOError as e:
                     # IOError will be thrown if the read is unsuccessful.
@@ -113,7 +130,7 @@ class AudioProducer(Thread):
                     # input buffer overflow IOErrors due to not consuming the
                     # buffers quickly enough will be silently ignored.
                     LOG.exception('IOError Exception in AudioProducer')
-                    if e.errno == pyaudio.paInputOverflowed:
+                    if e.errno == source.stream.overflow_errno:
                         pass  # Ignore overflow errors
                     elif restart_attempts < MAX_MIC_RESTARTS:
                         # restart the mic
@@ -189,6 +206,8 @@ class AudioConsumer(Thread):
             self.stt.stream_data(data)
         elif tag == STREAM_STOP:
             self.stt.stream_stop()
+        elif tag == STREAM_END:
+            self.process_stream(data)
         else:
             LOG.error("Unknown audio queue type %r" % audio)
 
@@ -202,14 +221,23 @@ class AudioConsumer(Thread):
         if self._audio_length(audio) < self.MIN_AUDIO_SIZE:
             LOG.warning("Audio too short to be processed")
         else:
-            transcription = self.transcribe(audio)
-            if transcription:
-                # STT succeeded, send the transcribed speech on for processing
-                payload = {
-                    'utterances': [transcription],
-                    'lang': self.stt.lang
-                }
-                self.emitter.emit("recognizer_loop:utterance", payload)
+            self._emit_transcription(self.transcribe(audio))
+
+    def process_stream(self, audio_length):
+        """Transcribe a phrase that was only sent through the STT stream."""
+        if audio_length < self.MIN_AUDIO_SIZE:
+            LOG.warning("Audio too short to be processed")
+        else:
+            self._emit_transcription(self.transcribe(None))
+
+    def _emit_transcription(self, transcription):
+        if transcription:
+            # STT succeeded, send the transcribed speech on for processing
+            payload = {
+                'utterances': [transcription],
+                'lang': self.stt.lang
+            }
+            self.emitter.emit("recognizer_loop:utterance", payload)
 
     def _compile_metadata(self, utterance):
         timestamp = str(int(1000 * get_time()))
@@ -230,15 +258,19 @@ class AudioConsumer(Thread):
             self.emitter.emit('recognizer_loop:speech.recognition.unknown')
 
         try:
-            # Invoke the STT engine on the audio clip
-            text = self.stt.execute(audio)
+            if audio is None:
+                # phrase was streamed, finish the stream to get the result
+                text = self.stt.stream_stop()
+            else:
+                # Invoke the STT engine on the audio clip
+                text = self.stt.execute(audio)
             if text is not None:
                 text = text.lower().strip()
                 LOG.debug("STT: " + text)
             else:
                 send_unknown_intent()
                 LOG.info('no words were transcribed')
-            if self.save_utterances:
+            if self.save_utterances and audio is not None:
                 mtd = self._compile_metadata(text)
 
                 filename = os.path.join(self.saved_utterances_dir, mtd["name"])
@@ -317,6 +349,7 @@ class RecognizerLoop(EventEmitter):
 
         LOG.debug('Using microphone (None = default): ' + str(device_index))
 
+        # the microphone owns the only long lived PyAudio instance
         self.microphone = MutableMicrophone(device_index, rate,
                                             mute=self.mute_calls > 0)
         self.responsive_recognizer = ResponsiveRecognizer()
@@ -329,7 +362,9 @@ class RecognizerLoop(EventEmitter):
         queue = Queue()
         stream_handler = None
         if stt.can_stream:
-            stream_handler = AudioStreamHandler(queue)
+            # saving utterances needs the full phrase audio
+            stream_handler = AudioStreamHandler(
+                queue, is_streaming=not self.config.get('record_utterances'))
         LOG.debug("Using STT engine: " + stt.__class__.__name__)
         self.producer = AudioProducer(self.state, queue, self.microphone,
                                       self.responsive_recognizer, self,
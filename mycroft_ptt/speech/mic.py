@@ -16,7 +16,7 @@ import audioop
 from time import sleep
 from collections import deque
 import os
-import pyaudio
+import numpy as np
 import speech_recognition
 from speech_recognition import (
     Microphone,
@@ -24,26 +24,68 @@ from speech_recognition import (
     AudioData
 )
 from threading import Lock
+from queue import SimpleQueue, Empty
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional (pip install HiveMind-PtT[numba]), without it the
+    # VAD update runs as plain python
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    # inotify_simple is only installed on linux, fall back to polling
+    INotify = None
 
 from mycroft_ptt.configuration import CONFIGURATION
-from mycroft_ptt.speech.signal import check_for_signal
+from mycroft_ptt.speech.signal import check_for_signal, check_for_signal_fd, \
+    get_ipc_directory
 from mycroft_ptt.playback import play_audio, play_mp3, play_ogg, play_wav, \
     resolve_resource_file
 from ovos_utils.log import LOG
 
 
 class MutableStream:
-    def __init__(self, wrapped_stream, format, muted=False):
+    # seconds to block waiting for audio before re-checking the muted flag
+    READ_TIMEOUT = 0.5
+
+    def __init__(self, wrapped_stream, format, queue, pyaudio_module,
+                 muted=False):
+        """
+        Arguments:
+            wrapped_stream: pyaudio stream opened in callback mode, stopped
+            format: pyaudio sample format of the stream
+            queue (SimpleQueue): receives (data, status) tuples from the
+                                 stream callback
+            pyaudio_module: the pyaudio module the stream was opened with
+            muted (bool): leave the stream stopped until unmute is called
+        """
         assert wrapped_stream is not None
         self.wrapped_stream = wrapped_stream
+        self.queue = queue
 
-        self.muted = muted
-        if muted:
-            self.mute()
-
-        self.SAMPLE_WIDTH = pyaudio.get_sample_size(format)
+        self.SAMPLE_WIDTH = pyaudio_module.get_sample_size(format)
+        self._overflow_flag = pyaudio_module.paInputOverflow
+        # errno of the IOError raised by read on an input overflow
+        self.overflow_errno = pyaudio_module.paInputOverflowed
         self.muted_buffer = b''.join([b'\x00' * self.SAMPLE_WIDTH])
         self.read_lock = Lock()
+        # audio received from the callback but not yet returned by read
+        self._residual = b''
+
+        # the latency is fixed when the stream is opened, check it only once
+        self.input_latency = self.wrapped_stream.get_input_latency()
+        if self.input_latency > 0.2:
+            LOG.warning("High input latency: %f" % self.input_latency)
+
+        self.muted = muted
+        if not muted:
+            self.wrapped_stream.start_stream()
 
     def mute(self):
         """Stop the stream and set the muted flag."""
@@ -55,43 +97,65 @@ class MutableStream:
         """Start the stream and clear the muted flag."""
         with self.read_lock:
             self.muted = False
+            # drop audio captured before the stream was muted
+            self._residual = b''
+            while not self.queue.empty():
+                self.queue.get_nowait()
             self.wrapped_stream.start_stream()
 
     def read(self, size, of_exc=False):
         """Read data from stream.
 
         Arguments:
-            size (int): Number of bytes to read
+            size (int): Number of frames to read
             of_exc (bool): flag determining if the audio producer thread
                            should throw IOError at overflows.
 
         Returns:
             (bytes) Data read from device
         """
-        frames = deque()
-        remaining = size
+        # size is given in frames, the stream is always mono
+        num_bytes = size * self.SAMPLE_WIDTH
+        buf = None
+        offset = 0
         with self.read_lock:
-            while remaining > 0:
-                # If muted during read return empty buffer. This ensures no
-                # reads occur while the stream is stopped
-                if self.muted:
-                    return self.muted_buffer
-
-                to_read = min(self.wrapped_stream.get_read_available(),
-                              remaining)
-                if to_read <= 0:
-                    sleep(.01)
-                    continue
-                result = self.wrapped_stream.read(to_read,
-                                                  exception_on_overflow=of_exc)
-                frames.append(result)
-                remaining -= to_read
-
-        input_latency = self.wrapped_stream.get_input_latency()
-        if input_latency > 0.2:
-            LOG.warning("High input latency: %f" % input_latency)
-        audio = b"".join(list(frames))
-        return audio
+            while offset < num_bytes:
+                if self._residual:
+                    result = self._residual
+                    self._residual = b''
+                else:
+                    # If muted during read return empty buffer. This ensures
+                    # no reads occur while the stream is stopped
+                    if self.muted:
+                        return self.muted_buffer
+
+                    try:
+                        result, status = self.queue.get(
+                            timeout=self.READ_TIMEOUT)
+                    except Empty:
+                        # PortAudio stops calling back when the device
+                        # fails, raise so the producer can restart the mic
+                        if not self.wrapped_stream.is_active():
+                            raise IOError("Input stream is no longer active")
+                        continue
+                    if of_exc and status & self._overflow_flag:
+                        raise IOError(self.overflow_errno,
+                                      "Input overflowed")
+
+                if buf is None:
+                    if len(result) == num_bytes:
+                        # the callback delivers whole chunks of the size
+                        # being read, hand those over without copying
+                        return result
+                    buf = bytearray(num_bytes)
+                    view = memoryview(buf)
+                n = min(len(result), num_bytes - offset)
+                view[offset:offset + n] = memoryview(result)[:n]
+                offset += n
+                if n < len(result):
+                    self._residual = result[n:]
+
+        return bytes(buf)
 
     def close(self):
         self.wrapped_stream.close()
@@ -122,17 +186,29 @@ class MutableMicrophone(Microphone):
 
     def _start(self):
         """Open the selected device and setup the stream."""
+        import pyaudio
         assert self.stream is None, \
             "This audio source is already inside a context manager"
+        self._pa_continue = pyaudio.paContinue
+        # the microphone is the only owner of a PyAudio instance, a new one
+        # per start so a restart enumerates the devices again
         self.audio = pyaudio.PyAudio()
+        self._queue = SimpleQueue()
         self.stream = MutableStream(self.audio.open(
             input_device_index=self.device_index, channels=1,
             format=self.format, rate=self.SAMPLE_RATE,
             frames_per_buffer=self.CHUNK,
             input=True,  # stream is an input stream
-        ), self.format, self.muted)
+            start=False,  # started by MutableStream unless muted
+            stream_callback=self._on_audio
+        ), self.format, self._queue, pyaudio, self.muted)
         return self
 
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        """PyAudio callback, hands captured audio over to MutableStream."""
+        self._queue.put((in_data, status))
+        return None, self._pa_continue
+
     def __exit__(self, exc_type, exc_value, traceback):
         return self._stop()
 
@@ -148,6 +224,7 @@ class MutableMicrophone(Microphone):
 
         self.stream = None
         self.audio.terminate()
+        self.audio = None
 
     def restart(self):
         """Shutdown input device and restart."""
@@ -168,8 +245,79 @@ class MutableMicrophone(Microphone):
         return self.muted
 
 
-def get_silence(num_bytes):
-    return b'\0' * num_bytes
+# reusable phrase buffers, avoids allocating a new one for every utterance
+_PHRASE_BUF_POOL = deque()
+_PHRASE_BUF_LOCK = Lock()
+
+
+def _acquire_phrase_buffer(size):
+    """Get a bytearray of at least size bytes from the pool."""
+    with _PHRASE_BUF_LOCK:
+        while _PHRASE_BUF_POOL:
+            buf = _PHRASE_BUF_POOL.pop()
+            if len(buf) >= size:
+                return buf
+    return bytearray(size)
+
+
+def _release_phrase_buffer(buf):
+    """Return a bytearray to the pool so the next phrase can reuse it."""
+    with _PHRASE_BUF_LOCK:
+        _PHRASE_BUF_POOL.append(buf)
+
+
+@njit(cache=True)
+def _update_vad_state(energy, noise, num_loud_chunks, num_chunks,
+                      silence_duration, energy_threshold, inv_multiplier,
+                      noise_up, noise_down, sec_per_buffer, min_loud_chunks,
+                      min_silence_at_end, max_chunks_of_silence,
+                      damping, energy_ratio, dynamic_enabled):
+    """Update the phrase end detection state with a new chunk's energy.
+
+    Compiled with numba when available, this runs once per recorded chunk.
+    damping is the dynamic energy damping already scaled to the chunk
+    duration.
+
+    Returns:
+        tuple: (noise, num_loud_chunks, silence_duration, energy_threshold,
+                phrase_complete)
+    """
+    max_noise = 25.0
+    min_noise = 0.0
+
+    is_loud = energy * inv_multiplier > energy_threshold
+    if is_loud:
+        if noise < max_noise:
+            noise += noise_up
+        num_loud_chunks += 1
+    else:
+        if noise > min_noise:
+            noise -= noise_down
+        if dynamic_enabled and energy > 0:
+            target_energy = energy * energy_ratio
+            energy_threshold = (energy_threshold * damping +
+                                target_energy * (1 - damping))
+
+    was_loud_enough = num_loud_chunks > min_loud_chunks
+
+    quiet_enough = noise <= min_noise
+    if quiet_enough:
+        silence_duration += sec_per_buffer
+        if silence_duration < min_silence_at_end:
+            quiet_enough = False  # gotta be silent for min of 1/4 sec
+    else:
+        silence_duration = 0.0
+    recorded_too_much_silence = num_chunks > max_chunks_of_silence
+    phrase_complete = quiet_enough and \
+        (was_loud_enough or recorded_too_much_silence)
+
+    return (noise, num_loud_chunks, silence_duration, energy_threshold,
+            phrase_complete)
+
+
+# signals can be checked relative to a directory fd (not on windows)
+_SIGNAL_DIR_FD_SUPPORTED = hasattr(os, "O_DIRECTORY") and \
+    os.stat in os.supports_dir_fd and os.unlink in os.supports_dir_fd
 
 
 class ResponsiveRecognizer(speech_recognition.Recognizer):
@@ -181,9 +329,10 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         self.overflow_exc = listener_config.get('overflow_exception', False)
 
         speech_recognition.Recognizer.__init__(self)
-        self.audio = pyaudio.PyAudio()
         self.multiplier = listener_config.get('multiplier')
-        self.energy_ratio = listener_config.get('energy_ratio')
+        # compare energy / multiplier against the threshold in the VAD loop
+        self._inv_multiplier = 1.0 / self.multiplier
+        self.energy_ratio = float(listener_config.get('energy_ratio'))
         self.sec_between_signal_checks = \
             listener_config.get("sec_between_signal_checks", 0.2)
         self.recording_timeout_with_silence = \
@@ -191,7 +340,7 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         self.recording_timeout = listener_config.get("recording_timeout", 10.0)
         self.min_loud_sec = listener_config.get("min_loud_sec", 0.5)
         self.min_silence_at_end = \
-            listener_config.get("min_silence_at_end", 0.25)
+            float(listener_config.get("min_silence_at_end", 0.25))
         self.ambient_noise_adjustment_time = listener_config.get(
             "ambient_noise_adjustment_time", 0.5)
         self.auto_ambient_noise_adjustment = listener_config.get(
@@ -206,12 +355,68 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         self._listen_triggered = False
         self._should_adjust_noise = False
 
+        # signal directory fd and inotify watch, closed by stop()
+        self._signal_dir_fd = None
+        self._signal_watch = None
+        self._signal_lock = Lock()
+        self._open_signal_dir()
+
+        # compile the VAD kernel now, with the argument types used while
+        # recording, instead of inside the first phrase
+        _update_vad_state(0, 0.0, 0, 0, 0.0, float(self.energy_threshold),
+                          self._inv_multiplier, 0.0, 0.0, 0.0, 0,
+                          self.min_silence_at_end, 0, 0.0, self.energy_ratio,
+                          bool(self.dynamic_energy_threshold))
+
+    def _open_signal_dir(self):
+        """Open the signal directory, creating it if needed."""
+        signal_dir = get_ipc_directory(domain="signal")
+        # signals are looked up relative to this fd, saves resolving the
+        # signal directory path on every check
+        if _SIGNAL_DIR_FD_SUPPORTED:
+            self._signal_dir_fd = os.open(signal_dir,
+                                          os.O_RDONLY | os.O_DIRECTORY)
+        # wake up as soon as a signal file is created instead of polling
+        if INotify is not None:
+            self._signal_watch = INotify()
+            self._signal_watch.add_watch(
+                signal_dir, inotify_flags.CREATE | inotify_flags.MOVED_TO)
+
+    def _close_signal_dir(self):
+        if self._signal_watch is not None:
+            self._signal_watch.close()
+            self._signal_watch = None
+        if self._signal_dir_fd is not None:
+            os.close(self._signal_dir_fd)
+            self._signal_dir_fd = None
+
+    def _check_for_signal(self, signal_name, sec_lifetime=0):
+        if not _SIGNAL_DIR_FD_SUPPORTED:
+            return check_for_signal(signal_name, sec_lifetime)
+        with self._signal_lock:
+            if self._signal_dir_fd is None:
+                return False  # stopped
+            if os.fstat(self._signal_dir_fd).st_nlink == 0:
+                # the directory was removed (e.g. tmp cleanup), signals now
+                # go to a new one, reopen it
+                LOG.debug("Signal directory removed, reopening")
+                self._close_signal_dir()
+                self._open_signal_dir()
+            return check_for_signal_fd(signal_name, self._signal_dir_fd,
+                                       sec_lifetime)
+
     def record_sound_chunk(self, source):
         return source.stream.read(source.CHUNK, self.overflow_exc)
 
     @staticmethod
     def calc_energy(sound_chunk, sample_width):
-        return audioop.rms(sound_chunk, sample_width)
+        if sample_width != 2:
+            return audioop.rms(sound_chunk, sample_width)
+        # single vectorized pass, accumulate in int64 to avoid overflow
+        samples = np.frombuffer(sound_chunk, dtype=np.int16).astype(np.int64)
+        if not samples.size:
+            return 0
+        return int(np.sqrt(np.dot(samples, samples) / samples.size))
 
     def _record_phrase(
         self,
@@ -237,26 +442,22 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
 
         Returns:
             bytearray: complete audio buffer recorded, including any
-                       silence at the end of the user's utterance
+                       silence at the end of the user's utterance, or None
+                       if the phrase was only sent through a streaming
+                       handler
         """
 
         num_loud_chunks = 0
-        noise = 0
+        noise = 0.0
+        silence_duration = 0.0
 
-        max_noise = 25
-        min_noise = 0
+        # noise level change per loud / quiet chunk
+        noise_up = 200 * sec_per_buffer
+        noise_down = 100 * sec_per_buffer
 
-        silence_duration = 0
-
-        def increase_noise(level):
-            if level < max_noise:
-                return level + 200 * sec_per_buffer
-            return level
-
-        def decrease_noise(level):
-            if level > min_noise:
-                return level - 100 * sec_per_buffer
-            return level
+        # threshold damping per chunk, accounts for different chunk sizes
+        # and rates
+        damping = self.dynamic_energy_adjustment_damping ** sec_per_buffer
 
         # Smallest number of loud chunks required to return
         min_loud_chunks = int(self.min_loud_sec / sec_per_buffer)
@@ -269,50 +470,58 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         max_chunks_of_silence = int(self.recording_timeout_with_silence /
                                     sec_per_buffer)
 
-        # bytearray to store audio in
-        byte_data = get_silence(source.SAMPLE_WIDTH)
+        # streaming STT receives every chunk through the stream handler,
+        # the phrase is only buffered when that is not the final result
+        streaming = stream is not None and stream.is_streaming
+
+        # bytearray to store audio in, sized for the longest possible phrase
+        buf = None
+        byte_data = None
+        if not streaming:
+            buf = _acquire_phrase_buffer(
+                max_chunks * source.CHUNK * source.SAMPLE_WIDTH)
+            offset = 0
 
         if stream:
             stream.stream_start()
 
-        phrase_complete = False
-        while num_chunks < max_chunks and not phrase_complete:
-            if ww_frames:
-                chunk = ww_frames.popleft()
-            else:
-                chunk = self.record_sound_chunk(source)
-            byte_data += chunk
-            num_chunks += 1
-
-            if stream:
-                stream.stream_chunk(chunk)
-
-            energy = self.calc_energy(chunk, source.SAMPLE_WIDTH)
-            test_threshold = self.energy_threshold * self.multiplier
-            is_loud = energy > test_threshold
-            if is_loud:
-                noise = increase_noise(noise)
-                num_loud_chunks += 1
-            else:
-                noise = decrease_noise(noise)
-                self._adjust_threshold(energy, sec_per_buffer)
-
-            was_loud_enough = num_loud_chunks > min_loud_chunks
-
-            quiet_enough = noise <= min_noise
-            if quiet_enough:
-                silence_duration += sec_per_buffer
-                if silence_duration < self.min_silence_at_end:
-                    quiet_enough = False  # gotta be silent for min of 1/4 sec
+        try:
+            phrase_complete = False
+            while num_chunks < max_chunks and not phrase_complete:
+                if ww_frames:
+                    chunk = ww_frames.popleft()
+                else:
+                    chunk = self.record_sound_chunk(source)
+                if buf is not None:
+                    buf[offset:offset + len(chunk)] = chunk
+                    offset += len(chunk)
+                num_chunks += 1
+
+                if stream:
+                    stream.stream_chunk(chunk)
+
+                energy = self.calc_energy(chunk, source.SAMPLE_WIDTH)
+                (noise, num_loud_chunks, silence_duration,
+                 self.energy_threshold, phrase_complete) = _update_vad_state(
+                    energy, noise, num_loud_chunks, num_chunks,
+                    silence_duration, float(self.energy_threshold),
+                    self._inv_multiplier, noise_up, noise_down,
+                    sec_per_buffer, min_loud_chunks,
+                    self.min_silence_at_end, max_chunks_of_silence,
+                    damping, self.energy_ratio,
+                    bool(self.dynamic_energy_threshold))
+
+                # Pressing top-button will end recording immediately
+                if self._check_for_signal('buttonPress'):
+                    phrase_complete = True
+
+            if streaming:
+                stream.finalize(num_chunks * sec_per_buffer)
             else:
-                silence_duration = 0
-            recorded_too_much_silence = num_chunks > max_chunks_of_silence
-            if quiet_enough and (was_loud_enough or recorded_too_much_silence):
-                phrase_complete = True
-
-            # Pressing top-button will end recording immediately
-            if check_for_signal('buttonPress'):
-                phrase_complete = True
+                byte_data = bytes(memoryview(buf)[:offset])
+        finally:
+            if buf is not None:
+                _release_phrase_buffer(buf)
 
         return byte_data
 
@@ -325,16 +534,17 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
 
         For example when we are in a dialog with the user.
         """
-        if check_for_signal('startListening') or self._listen_triggered:
+        if self._check_for_signal('startListening') or \
+                self._listen_triggered:
             return True
 
         # Pressing the button can start recording (unless
         # it is being used to mean 'stop' instead)
-        if check_for_signal('buttonPress', 1):
+        if self._check_for_signal('buttonPress', 1):
             # give other processes time to consume this signal if
             # it was meant to be a 'stop'
             sleep(0.25)
-            if check_for_signal('buttonPress'):
+            if self._check_for_signal('buttonPress'):
                 # Signal is still here, assume it was intended to
                 # begin recording
                 LOG.debug("Button Pressed, listen signal not needed")
@@ -347,6 +557,8 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
             Signal stop and exit waiting state.
         """
         self._stop_signaled = True
+        with self._signal_lock:
+            self._close_signal_dir()
 
     def trigger_listen(self):
         """Externally trigger listening."""
@@ -364,6 +576,18 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         LOG.info("Ambient noise profile has been created")
         self._should_adjust_noise = False
 
+    def _wait_for_signal_event(self):
+        """Block until a signal file is created or the check interval ends.
+
+        Without inotify support this is a plain sleep.
+        """
+        with self._signal_lock:
+            if self._signal_watch is not None:
+                self._signal_watch.read(
+                    timeout=int(self.sec_between_signal_checks * 1000))
+                return
+        sleep(self.sec_between_signal_checks)
+
     def _wait_for_listen_signal(self, source):
         """Listen continuously on source until a listen signal is detected
         Args:
@@ -372,10 +596,10 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         """
 
         while not self._stop_signaled and not self._is_listen_signaled():
-            if check_for_signal('adjustAmbientNoise') or \
+            if self._check_for_signal('adjustAmbientNoise') or \
                     self._should_adjust_noise:
                 self._adjust_ambient_noise(source)
-            sleep(self.sec_between_signal_checks)
+            self._wait_for_signal_event()
 
         # If enabled, play a wave file with a short sound to audibly
         # indicate listen signal was detected.
@@ -419,6 +643,7 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
 
         Returns:
             AudioData: audio with the user's utterance, minus the wake-up-word
+                       or None if the utterance was streamed to the STT
         """
         assert isinstance(source, AudioSource), "Source must be an AudioSource"
 
@@ -438,19 +663,11 @@ class ResponsiveRecognizer(speech_recognition.Recognizer):
         bus.emit("recognizer_loop:record_begin")
 
         frame_data = self._record_phrase(source, sec_per_buffer, stream)
-        audio_data = self._create_audio_data(frame_data, source)
+        audio_data = None
+        if frame_data is not None:
+            audio_data = self._create_audio_data(frame_data, source)
         bus.emit("recognizer_loop:record_end")
         if self.auto_ambient_noise_adjustment:
             self._adjust_ambient_noise(source)
         LOG.debug("Thinking...")
         return audio_data
-
-    def _adjust_threshold(self, energy, seconds_per_buffer):
-        if self.dynamic_energy_threshold and energy > 0:
-            # account for different chunk sizes and rates
-            damping = (
-                    self.dynamic_energy_adjustment_damping ** seconds_per_buffer)
-            target_energy = energy * self.energy_ratio
-            self.energy_threshold = (
-                    self.energy_threshold * damping +
-                    target_energy * (1 - damping))
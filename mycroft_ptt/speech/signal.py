@@ -14,6 +14,7 @@
 #
 import os
 import os.path
+import stat
 import tempfile
 import time
 from mycroft_ptt.configuration import CONFIGURATION
@@ -121,3 +122,41 @@ def check_for_signal(signal_name, sec_lifetime=0):
 
     # No such signal exists
     return False
+
+
+def check_for_signal_fd(signal_name, dir_fd, sec_lifetime=0):
+    """See if a named signal exists, relative to an open signal directory
+
+    Same as check_for_signal, but the signal is looked up with dir_fd so
+    the signal directory path is not resolved again on every check.
+
+    Args:
+        signal_name (str): The signal's name.  Must only contain characters
+            valid in filenames.
+        dir_fd (int): file descriptor of the signal directory, as returned
+            by os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        sec_lifetime (int, optional): How many seconds the signal should
+            remain valid.  If 0 or not specified, it is a single-use signal.
+            If -1, it never expires.
+
+    Returns:
+        bool: True if the signal is defined, False otherwise
+    """
+    try:
+        signal_stat = os.stat(signal_name, dir_fd=dir_fd)
+    except FileNotFoundError:
+        # No such signal exists
+        return False
+    if not stat.S_ISREG(signal_stat.st_mode):
+        return False
+
+    if sec_lifetime == 0:
+        # consume this single-use signal
+        os.unlink(signal_name, dir_fd=dir_fd)
+    elif sec_lifetime == -1:
+        return True
+    elif int(signal_stat.st_ctime + sec_lifetime) < int(time.time()):
+        # remove once expired
+        os.unlink(signal_name, dir_fd=dir_fd)
+        return False
+    return True
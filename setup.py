@@ -14,7 +14,13 @@ setup(
                       "psutil",
                       "PyAudio==0.2.11",
                       "ovos_utils",
+                      "numpy",
+                      'inotify_simple; sys_platform == "linux"',
                       "text2speech"],
+    extras_require={
+        # compiles the voice activity detection loop
+        "numba": ["numba"]
+    },
     include_package_data=True,
     url='https://github.com/JarbasHiveMind/HiveMind-PTT',
     license='Apache2',